@@ -1,16 +1,31 @@
+import atexit
+import logging
 import sqlite3
-from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+import time
 from config.settings import Settings
 import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
 
 
 class DatabaseManager:
     _instance_lock = threading.Lock()
-    _pool = ThreadPoolExecutor(max_workers=5)  # 根据CPU核心数调整
+    _BATCH_SIZE = 50  # 单个事务最多写入的行数
+    _FLUSH_INTERVAL = 0.5  # 单批次最长等待时间（秒）
+    _RING_SIZE = 10000  # 待写入缓冲区容量，写满后丢弃最旧的数据而不阻塞调用方
+
+    # WAL 模式持久化在数据库文件上，只需设置一次；其余为连接级设置
+    _DB_PRAGMAS = ("journal_mode=WAL",)
+    _CONN_PRAGMAS = ("synchronous=NORMAL", "temp_store=MEMORY", "mmap_size=268435456", "cache_size=-20000")
+
+    _SQL = {
+        'signals': 'INSERT INTO signals VALUES (NULL,?,?,?,?,?,?,?,?,?,?)',
+        'logs': 'INSERT INTO logs VALUES (NULL,?,?,?)',
+    }
 
     def __new__(cls):
-        """单例模式确保线程池唯一"""
+        """单例模式确保写线程唯一"""
         if not hasattr(cls, "_instance"):
             with cls._instance_lock:
                 if not hasattr(cls, "_instance"):
@@ -20,87 +35,138 @@ class DatabaseManager:
 
     def _init_db(self):
         """初始化数据库连接（仅主线程执行）"""
-        with self._get_connection() as conn:
-            cursor = conn.cursor()
-            # 创建信号表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS signals (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp DATETIME,
-                    symbol TEXT,
-                    timeframe TEXT,
-                    direction TEXT,
-                    entry_price REAL,
-                    stop_loss REAL,
-                    take_profit REAL,
-                    position_size REAL,
-                    leverage INTEGER,
-                    confidence REAL
-                )
-            ''')
-            # 创建日志表
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp DATETIME,
-                    level TEXT,
-                    message TEXT
-                )
-            ''')
-            conn.commit()
+        # 唯一的长连接：建表后交由写线程独占使用
+        self._conn = sqlite3.connect(Settings.DB_PATH, check_same_thread=False, isolation_level=None)
+        for p in self._DB_PRAGMAS + self._CONN_PRAGMAS:
+            self._conn.execute(f"PRAGMA {p}")
+        # 创建信号表
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS signals (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER,  -- 毫秒时间戳
+                symbol TEXT,
+                timeframe TEXT,
+                direction TEXT,
+                entry_price REAL,
+                stop_loss REAL,
+                take_profit REAL,
+                position_size REAL,
+                leverage INTEGER,
+                confidence REAL
+            )
+        ''')
+        # 创建日志表
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER,  -- 毫秒时间戳
+                level TEXT,
+                message TEXT
+            )
+        ''')
+        # 按时间范围 + 交易对/级别查询的索引
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_signals_ts_sym ON signals(timestamp, symbol)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_logs_ts_level ON logs(timestamp, level)')
+
+        # 后台单写线程：批量消费环形缓冲区，一个事务提交一批
+        # deque 的 append/popleft 在 CPython 中是原子操作，无需额外加锁
+        self._ring = deque(maxlen=self._RING_SIZE)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
 
     @staticmethod
-    def _get_connection():
-        """获取新的数据库连接（线程安全）"""
-        return sqlite3.connect(Settings.DB_PATH, check_same_thread=False)
+    def _signal_row(signal):
+        """交易信号 -> signals 表的一行"""
+        return (
+            signal.timestamp,
+            signal.symbol,
+            signal.timeframe,
+            signal.direction,
+            signal.entry_price,
+            signal.stop_loss,
+            signal.take_profit,
+            signal.position_size,
+            signal.leverage,
+            signal.confidence
+        )
 
     def log_signal(self, signal):
         """异步记录交易信号（保持参数不变）"""
-        self._pool.submit(self._log_signal_impl, signal)
+        self._ring.append(('signals', self._signal_row(signal)))
+        self._wake.set()
 
-    def _log_signal_impl(self, signal):
-        """实际的信号记录实现"""
-        try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO signals VALUES (
-                        NULL,?,?,?,?,?,?,?,?,?,?
-                    )
-                ''', (
-                    datetime.now(),
-                    signal.symbol,
-                    signal.timeframe,
-                    signal.direction,
-                    signal.entry_price,
-                    signal.stop_loss,
-                    signal.take_profit,
-                    signal.position_size,
-                    signal.leverage,
-                    signal.confidence
-                ))
-                conn.commit()
-        except Exception as e:
-            self.log_message("ERROR", f"记录信号失败: {str(e)}")
+    def log_signals(self, signals):
+        """异步批量记录交易信号，同批数据由写线程在一个事务中写入"""
+        self._ring.extend(('signals', self._signal_row(signal)) for signal in signals)
+        self._wake.set()
 
     def log_message(self, level, message):
         """异步记录日志（保持参数不变）"""
-        self._pool.submit(self._log_message_impl, level, message)
+        self._ring.append(('logs', (time.time_ns() // 1_000_000, level, message)))
+        self._wake.set()
 
-    def _log_message_impl(self, level, message):
-        """实际的日志记录实现"""
+    def _drain(self):
+        """取出一批待写入的行：最多 _BATCH_SIZE 条"""
+        batch = []
+        while self._ring and len(batch) < self._BATCH_SIZE:
+            batch.append(self._ring.popleft())
+        return batch
+
+    def _write_batch(self, batch):
+        """在单个事务中写入一批数据"""
+        conn = self._conn
         try:
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO logs VALUES (
-                        NULL,?,?,?
-                    )
-                ''', (datetime.now(), level, message))
-                conn.commit()
+            # 按表分组，同一条语句只解析一次、批量绑定
+            groups = {}
+            for table, row in batch:
+                groups.setdefault(table, []).append(row)
+            conn.execute("BEGIN")
+            for table, rows in groups.items():
+                conn.executemany(self._SQL[table], rows)
+            conn.execute("COMMIT")
         except Exception as e:
-            print(f"日志记录失败: {str(e)}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.warning("批量写入失败，改为逐条写入: %s", e)
+            self._write_rows(batch)
+
+    def _write_rows(self, batch):
+        """逐条写入（自动提交），单条失败只丢弃该条"""
+        dropped = 0
+        for table, row in batch:
+            try:
+                self._conn.execute(self._SQL[table], row)
+            except Exception as e:
+                dropped += 1
+                logger.error("日志记录失败: %s 表 %r: %s", table, row, e)
+        if dropped:
+            logger.error("本批 %d 条中丢弃 %d 条", len(batch), dropped)
+
+    def _writer_loop(self):
+        """写线程主循环"""
+        while not (self._stop.is_set() and not self._ring):
+            # 有新数据或超时（最长 _FLUSH_INTERVAL 秒）后批量写入
+            self._wake.wait(timeout=self._FLUSH_INTERVAL)
+            self._wake.clear()
+            while batch := self._drain():
+                self._write_batch(batch)
+
+    def close(self):
+        """刷新缓冲区中剩余数据并停止写线程"""
+        self._stop.set()
+        self._wake.set()
+        if self._writer.is_alive():
+            self._writer.join()
+        try:
+            # 关闭前更新查询规划器统计信息
+            self._conn.execute("PRAGMA optimize")
+        except sqlite3.ProgrammingError:
+            pass  # 连接已关闭
+        self._conn.close()
 
     def __del__(self):
         """清理资源"""
-        self._pool.shutdown(wait=True)
\ No newline at end of file
+        self.close()
@@ -1,12 +1,53 @@
+import asyncio
 import ccxt
+import ccxt.async_support as ccxt_async
+import httpx
 import logging
-from functools import lru_cache
-from tenacity import retry, stop_after_attempt, wait_exponential
+import orjson
+import threading
+import time
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from config.settings import Settings
+import numpy as np
 import pandas as pd
 
+# K线周期单位对应的秒数（月线按自然月单独处理）
+_TF_UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'W': 604800}
+# Unix纪元是周四，币安周线从周一 00:00 UTC 开盘，需偏移4天对齐
+_WEEK_OFFSET = 4 * 86400
+
+
+def _tf_seconds(timeframe):
+    """将 '15m'/'4h'/'1d' 等周期转换为秒数"""
+    return int(timeframe[:-1]) * _TF_UNIT_SECONDS[timeframe[-1]]
+
+
+def _bar_index(timeframe, now):
+    """返回 now 所处K线的序号，序号变化即新K线开盘（与币安K线开盘时间对齐）"""
+    unit = timeframe[-1]
+    if unit == 'M':
+        # 月线按自然月开盘（每月1日 00:00 UTC）
+        t = time.gmtime(now)
+        return (t.tm_year * 12 + t.tm_mon - 1) // int(timeframe[:-1])
+    if unit in ('w', 'W'):
+        now -= _WEEK_OFFSET
+    return int(now // _tf_seconds(timeframe))
+
+
+# K线请求重试策略：只重试网络类/限频类的瞬时错误（DDoSProtection、RateLimitExceeded 均为 NetworkError 子类），
+# 鉴权失败、交易对错误等交易所错误直接抛出；带抖动的指数退避避免多交易对同时重试
+_ohlcv_retry = retry(
+    retry=retry_if_exception_type(ccxt.NetworkError),
+    wait=wait_exponential_jitter(initial=1, max=30, jitter=0.5),
+    stop=stop_after_attempt(3),
+)
+
 
 class BinanceFutureClient:
+    _FAPI_URL = 'https://fapi.binance.com'
+    _CACHE_MAXSIZE = 200  # K线缓存最大条目数
+    _MAX_CONCURRENCY = 10  # 并发拉取K线的最大请求数
+
     def __init__(self):
         config = {
             'apiKey': Settings.BINANCE_API_KEY,
@@ -23,6 +64,16 @@ class BinanceFutureClient:
             }
         }
         self.exchange = ccxt.binance(config)
+        # 异步客户端用于批量并发拉取（aiohttp 代理配置方式不同）
+        async_config = {k: v for k, v in config.items() if k != 'proxies'}
+        async_config['aiohttp_proxy'] = Settings.PROXY
+        self.async_exchange = ccxt_async.binance(async_config)
+        # 行情直连客户端：绕过ccxt的通用解析层，连接池复用（同步/异步各一个）
+        self.http = httpx.Client(base_url=self._FAPI_URL, http2=True, proxy=Settings.PROXY, timeout=15)
+        self.async_http = httpx.AsyncClient(base_url=self._FAPI_URL, http2=True, proxy=Settings.PROXY, timeout=15)
+        # K线缓存：(symbol, timeframe, limit, K线序号) -> 数据，新K线开始后自然失效
+        self._ohlcv_cache = {}
+        self._cache_lock = threading.Lock()
 
     def _sync_time(self):
         try:
@@ -32,17 +83,138 @@ class BinanceFutureClient:
         except Exception as e:
             logging.warning(f"时间同步失败: {str(e)}")
 
-    @retry(stop=stop_after_attempt(3),
-           wait=wait_exponential(multiplier=1, min=2, max=10))
-    @lru_cache(maxsize=100)
+    @staticmethod
+    def _cache_key(symbol, timeframe, limit):
+        """缓存键包含当前所处K线的序号，同一根K线内的重复请求命中缓存"""
+        return symbol, timeframe, limit, _bar_index(timeframe, time.time())
+
     def get_ohlcv(self, symbol, timeframe, limit=100):
+        """
+        获取K线数据（带按K线周期失效的缓存）
+        :return: (N, 6) float64 只读数组：timestamp/open/high/low/close/volume
+        """
+        key = self._cache_key(symbol, timeframe, limit)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        # 优先直连行情接口，失败时回退到ccxt；仅缓存成功的结果
+        try:
+            data = self.fast_klines(symbol, timeframe, limit)
+        except Exception as e:
+            logging.warning(f"K线直连失败，回退ccxt: {str(e)}")
+            data = self._fetch_ohlcv(symbol, timeframe, limit)
+        self._cache_put(key, data)
+        return data
+
+    def fast_klines(self, symbol, timeframe, limit=100):
+        """
+        直接请求 /fapi/v1/markPriceKlines（与 ccxt 的 {'price': 'mark'} 相同的标记价格K线）
+        :return: (N, 6) float64 只读数组
+        """
+        response = self.http.get('/fapi/v1/markPriceKlines', params=self._klines_params(symbol, timeframe, limit))
+        response.raise_for_status()
+        return self._parse_klines(response.content)
+
+    async def fast_klines_async(self, symbol, timeframe, limit=100):
+        """fast_klines 的异步版本"""
+        response = await self.async_http.get('/fapi/v1/markPriceKlines',
+                                             params=self._klines_params(symbol, timeframe, limit))
+        response.raise_for_status()
+        return self._parse_klines(response.content)
+
+    def _klines_params(self, symbol, timeframe, limit):
+        return {
+            'symbol': symbol.split(':')[0].replace('/', ''),  # BTC/USDT -> BTCUSDT
+            'interval': self.exchange.timeframes.get(timeframe, timeframe),
+            'limit': limit,
+        }
+
+    def _parse_klines(self, content):
+        """原始K线JSON转换为 (N, 6) 只读数组"""
+        return self._to_array([row[:6] for row in orjson.loads(content)])
+
+    async def get_ohlcv_many(self, reqs):
+        """
+        并发获取多组K线数据，结果写入K线缓存，随后的 get_ohlcv 直接命中
+        :param reqs: [(symbol, timeframe, limit), ...]
+        :return: {(symbol, timeframe, limit): 数组或异常}
+        """
+        semaphore = asyncio.Semaphore(self._MAX_CONCURRENCY)
+
+        async def fetch(symbol, timeframe, limit):
+            key = self._cache_key(symbol, timeframe, limit)
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+            async with semaphore:
+                # 与 get_ohlcv 一致：优先直连行情接口，失败时回退到ccxt
+                try:
+                    data = await self.fast_klines_async(symbol, timeframe, limit)
+                except Exception as e:
+                    logging.warning(f"K线直连失败，回退ccxt: {str(e)}")
+                    data = await self._fetch_ohlcv_async(symbol, timeframe, limit)
+            self._cache_put(key, data)
+            return data
+
+        results = await asyncio.gather(*(fetch(*req) for req in reqs), return_exceptions=True)
+        return dict(zip(reqs, results))
+
+    async def close(self):
+        """释放异步客户端及直连客户端的连接资源"""
+        await self.async_exchange.close()
+        await self.async_http.aclose()
+        self.http.close()
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            return self._ohlcv_cache.get(key)
+
+    def _cache_put(self, key, data):
+        with self._cache_lock:
+            self._ohlcv_cache[key] = data
+            if len(self._ohlcv_cache) > self._CACHE_MAXSIZE:
+                # 淘汰最早写入的条目
+                self._ohlcv_cache.pop(next(iter(self._ohlcv_cache)))
+
+    @staticmethod
+    def _to_array(data):
+        """K线列表转换为 (N, 6) 只读数组"""
+        arr = np.asarray(data, dtype=np.float64).reshape(-1, 6)
+        # 缓存对象会被多个调用方共享，禁止原地修改
+        arr.flags.writeable = False
+        return arr
+
+    @_ohlcv_retry
+    def _fetch_ohlcv(self, symbol, timeframe, limit):
+        try:
+            data = self.exchange.fetch_ohlcv(
+                symbol,
+                timeframe,
+                limit=limit,
+                params={'price': 'mark'}
+            )
+            return self._to_array(data)
+        except ccxt.NetworkError as e:
+            logging.error(f"网络错误: {str(e)}")
+            raise
+        except ccxt.ExchangeError as e:
+            logging.error(f"交易所错误: {str(e)}")
+            raise
+        except Exception as e:
+            logging.error(f"未知错误: {str(e)}")
+            raise
+
+    @_ohlcv_retry
+    async def _fetch_ohlcv_async(self, symbol, timeframe, limit):
         try:
-            return self.exchange.fetch_ohlcv(
+            data = await self.async_exchange.fetch_ohlcv(
                 symbol,
                 timeframe,
                 limit=limit,
                 params={'price': 'mark'}
             )
+            return self._to_array(data)
         except ccxt.NetworkError as e:
             logging.error(f"网络错误: {str(e)}")
             raise
@@ -1,60 +1,93 @@
 # K线形态识别
+import logging
+from enum import IntEnum
+
+import numpy as np
+from numba import njit
+
+logger = logging.getLogger(__name__)
+
+
+class Direction(IntEnum):
+    """形态方向，取值与 detect_pinbar_batch 的标签一致"""
+    BULLISH = 1
+    BEARISH = -1
+
+
+# Pin Bar 批量检测结果标签 -> 形态方向
+PINBAR_LABELS = {1: Direction.BULLISH, -1: Direction.BEARISH, 0: None}
+
+
+@njit(cache=True)
+def _pinbar_labels(ohlc):
+    """Pin Bar 检测内核（Numba编译），规则与 detect_pinbar 一致"""
+    n = ohlc.shape[0]
+    labels = np.zeros(n, dtype=np.int8)
+    for i in range(n):
+        open_, high, low, close = ohlc[i, 0], ohlc[i, 1], ohlc[i, 2], ohlc[i, 3]
+        body = abs(close - open_)
+        total_range = high - low
+        # 振幅为0或实体占比超过30%
+        if total_range == 0 or body / total_range > 0.3:
+            continue
+        if close > open_ and (open_ - low) > 2 * body:  # 看涨Pin Bar（长下影）
+            labels[i] = 1
+        elif close < open_ and (high - open_) > 2 * body:  # 看跌Pin Bar（长上影）
+            labels[i] = -1
+    return labels
+
+
 class CandlePatternDetector:
+    @staticmethod
+    def detect_pinbar_batch(ohlc):
+        """
+        批量识别Pin Bar形态
+        :param ohlc: (N, 4) float64 数组，每行 [open, high, low, close]
+        :return: (N,) int8 数组：1 看涨 / -1 看跌 / 0 无形态
+        """
+        labels = _pinbar_labels(ohlc)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for (o, h, l, c), label in zip(ohlc.tolist(), labels.tolist()):
+                logger.debug("Pin Bar=%s,开盘价=%s,最高= %s,最低= %s, 收盘=%s", PINBAR_LABELS[label], o, h, l, c)
+        return labels
+
     @staticmethod
     def detect_pinbar(candle):
         """
-        识别Pin Bar形态
-        :param candle: dict {'open':, 'high':, 'low':, 'close':}
-        :return: 'bullish'/'bearish'/None
+        识别Pin Bar形态（单根K线，兼容接口）
+        :param candle: [open, high, low, close] 数组（OHLCV数组的一行切片）
+        :return: Direction/None
         """
-        body = abs(candle['close'] - candle['open'])
-        total_range = candle['high'] - candle['low']
-
-        if total_range == 0:
-            return None
-
-        # 实体占比小于30%
-        if body / total_range > 0.3:
-            return None
-
-        # 看涨Pin Bar（长下影）
-        if (candle['close'] > candle['open'] and
-                (candle['open'] - candle['low']) > 2 * body):
-            print(f"发现长下影线,开盘价={candle['open']},最高= {candle['high']},最低= {candle['low']}, 收盘={candle['close']}")
-            return 'bullish'
-
-        # 看跌Pin Bar（长上影）
-        if (candle['close'] < candle['open'] and
-                (candle['high'] - candle['open']) > 2 * body):
-            print(f"发现长上影线,开盘价={candle['open']},最高= {candle['high']},最低= {candle['low']}, 收盘={candle['close']}")
-            return 'bearish'
-        print(f"中性,开盘价={candle['open']},最高= {candle['high']},最低= {candle['low']}, 收盘={candle['close']}")
-        return None
+        label = CandlePatternDetector.detect_pinbar_batch(np.asarray(candle, dtype=np.float64).reshape(1, 4))
+        return PINBAR_LABELS[int(label[0])]
 
     @staticmethod
     def detect_engulfing(current, previous):
         """
         识别吞没形态
-        :param current: 当前K线
-        :param previous: 前一根K线
-        :return: 'bullish'/'bearish'/None
+        :param current: 当前K线 [open, high, low, close]
+        :param previous: 前一根K线 [open, high, low, close]
+        :return: Direction/None
         """
-        # body_current = abs(current['close'] - current['open'])
-        # body_prev = abs(previous['close'] - previous['open'])
+        # cur_open, _, _, cur_close = current
+        # prev_open, _, _, prev_close = previous
+        # body_current = abs(cur_close - cur_open)
+        # body_prev = abs(prev_close - prev_open)
         #
         # if body_current <= body_prev:
         #     return None
         #
         # # 看涨吞没
-        # if (current['close'] > current['open'] and
-        #         current['open'] < previous['close'] and
-        #         current['close'] > previous['open']):
-        #     return 'BULLISH'
+        # if (cur_close > cur_open and
+        #         cur_open < prev_close and
+        #         cur_close > prev_open):
+        #     return Direction.BULLISH
         #
         # # 看跌吞没
-        # if (current['close'] < current['open'] and
-        #         current['open'] > previous['close'] and
-        #         current['close'] < previous['open']):
-        #     return 'BEARISH'
+        # if (cur_close < cur_open and
+        #         cur_open > prev_close and
+        #         cur_close < prev_open):
+        #     return Direction.BEARISH
 
         return None
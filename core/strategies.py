@@ -1,32 +1,56 @@
 # 交易策略
 # core/strategies.py
+import asyncio
 import logging
-from dataclasses import dataclass
-from datetime import datetime
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
 from typing import Optional
 
 import numpy as np
 import talib  # 技术分析库，用于计算技术指标
+from numba import njit  # JIT编译指标递推
 
 from core.database import DatabaseManager  # 数据库管理模块
 from core.exchange import BinanceFutureClient  # 交易所接口
-from core.patterns import CandlePatternDetector  # K线形态检测模块
+from core.patterns import CandlePatternDetector, Direction, PINBAR_LABELS  # K线形态检测模块
 from core.risk import RiskManager  # 风险管理模块
 
 
+@njit(cache=True)
+def _ema_step(prev: float, close: float, period: int) -> float:
+    """EMA单步递推"""
+    return prev + 2.0 / (period + 1) * (close - prev)
+
+
+@njit(cache=True)
+def _atr_step(prev_atr: float, prev_close: float, high: float, low: float, close: float, period: int) -> float:
+    """ATR单步递推（Wilder平滑，与TA-Lib一致）"""
+    tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+    return (prev_atr * (period - 1) + tr) / period
+
+
+class Trend(IntEnum):
+    """高级别趋势，多空取值与 Direction 一致，可直接比较"""
+    BEARISH = -1
+    NEUTRAL = 0
+    BULLISH = 1
+
+
 @dataclass
 class TradingSignal:
     """交易信号数据结构"""
     symbol: str  # 交易对
     timeframe: str  # 时间周期
-    direction: str  # 交易方向 LONG/SHORT
+    direction: str  # 交易方向 BULLISH/BEARISH
     entry_price: float  # 入场价格
     stop_loss: float  # 止损价
     take_profit: float  # 止盈价
     position_size: float  # 仓位大小
     leverage: int  # 杠杆倍数
     confidence: float = 1.0  # 信号置信度（0-1）
-    timestamp: str = datetime.now().isoformat()  # 信号生成时间
+    timestamp: int = field(default_factory=lambda: time.time_ns() // 1_000_000)  # 信号生成时间（毫秒时间戳）
+    atr: float = field(default=0.0, repr=False)  # 生成信号时的ATR，供过滤器复用（不入库）
 
 
 class BaseStrategy:
@@ -47,6 +71,9 @@ class BaseStrategy:
 class ProfessionalPinBarStrategy(BaseStrategy):
     """专业版Pin Bar策略 - 结合吞没形态和高级别趋势分析"""
 
+    _SIGNAL_BARS = 100  # 当前周期K线数量
+    _TREND_BARS = 201  # 200根已收盘K线 + 1根未收盘K线，保证EMA200可播种
+
     def __init__(self):
         super().__init__()
         # 定义时间框架映射关系（当前周期→更高级别周期）
@@ -57,36 +84,57 @@ class ProfessionalPinBarStrategy(BaseStrategy):
             '4h': '1d',
             '1d': '1W'
         }
-
-    def analyze(self, symbol: str, timeframe: str) -> Optional[TradingSignal]:
-        """策略核心分析方法"""
+        # 增量指标状态，只推进到最后一根已收盘K线
+        # (symbol, timeframe, period) -> (K线时间戳, 指标值)
+        self._ema_state = {}
+        self._atr_state = {}
+
+    def analyze(self, symbol: str, timeframe: str, data: Optional[np.ndarray] = None,
+                trend_data: Optional[np.ndarray] = None) -> Optional[TradingSignal]:
+        """
+        策略核心分析方法
+        :param data: 预取的当前周期K线，None 时自行拉取
+        :param trend_data: 预取的高级别周期K线，None 时自行拉取
+        """
         try:
             # 获取当前时间框架数据
-            current_data = self._get_ohlcv(symbol, timeframe)
+            current_data = data if data is not None else self._get_ohlcv(symbol, timeframe, self._SIGNAL_BARS)
             # 数据不足时返回
             if len(current_data) < 50:
                 return None
 
             # 获取高级别趋势（用于信号过滤）
             higher_tf = self.higher_tf_map.get(timeframe)
-            trend = self._get_trend(symbol, higher_tf) if higher_tf else "NEUTRAL"
-
-            # 检测最新3根K线的形态
+            trend = self._get_trend(symbol, higher_tf, trend_data) if higher_tf else Trend.NEUTRAL
+            # ATR只依赖当前周期数据，每次分析只计算一次
+            atr = self._calculate_atr(symbol, timeframe, current_data)
+
+            # 检测最新3根K线的形态：按行切片 [open, high, low, close]
+            ohlc = current_data[-3:, 1:5]
+            # Pin Bar 一次性批量检测，并一次性算出三根K线的止损/止盈/置信度
+            pin_labels = self.pattern_detector.detect_pinbar_batch(ohlc)
+            stop_loss, take_profit, confidence = (a.tolist() for a in self._compute_levels(ohlc, pin_labels, atr))
+            pin_labels = pin_labels.tolist()
+            closes = ohlc[:, 3].tolist()
             signals = []
             for i in range(-3, 0):  # 遍历最新三根K线
-                current_candle = self._parse_candle(current_data[i])
-                prev_candle = self._parse_candle(current_data[i - 1]) if i > -3 else None
+                current_row = ohlc[i]
+                prev_row = ohlc[i - 1] if i > -3 else None
 
                 # 检测Pin Bar形态
-                if pin_signal := self.pattern_detector.detect_pinbar(current_candle):
+                if pin_signal := PINBAR_LABELS[pin_labels[i]]:
                     signals.append(self._create_signal(
-                        symbol, timeframe, pin_signal, current_candle, trend
+                        symbol, timeframe, pin_signal, trend, atr,
+                        closes[i], stop_loss[i], take_profit[i], confidence[i]
                     ))
 
                 # 检测吞没形态（需要前一根K线）
-                if prev_candle and (engulf_signal := self.pattern_detector.detect_engulfing(current_candle, prev_candle)):
+                if prev_row is not None and (
+                        engulf_signal := self.pattern_detector.detect_engulfing(current_row, prev_row)):
+                    direction_mask = np.array([engulf_signal])
+                    levels = self._compute_levels(ohlc[[i]], direction_mask, atr)
                     signals.append(self._create_signal(
-                        symbol, timeframe, engulf_signal, current_candle, trend
+                        symbol, timeframe, engulf_signal, trend, atr, closes[i], *(a.item() for a in levels)
                     ))
 
             # 过滤有效信号并选择置信度最高的
@@ -95,123 +143,174 @@ class ProfessionalPinBarStrategy(BaseStrategy):
                 return None
 
             # 选择置信度最高的信号
-            best_signal = max(valid_signals, key=lambda x: x.confidence)
-            # 记录信号到数据库
-            self.db.log_signal(best_signal)
-            return best_signal
+            # 信号由调度器统一批量入库
+            return max(valid_signals, key=lambda x: x.confidence)
 
         except Exception as e:
             logging.error(f"策略分析异常: {str(e)}")
             return None
 
-    def _get_ohlcv(self, symbol: str, timeframe: str, limit: int = 100) -> list:
-        """获取K线数据（原始格式）"""
+    async def analyze_many(self, symbols, timeframe: str) -> dict:
+        """
+        批量分析：先并发预取所有交易对的当前周期及高级别周期K线，再用预取结果逐个分析
+        （直接传入数组，不经过K线缓存，分析过程中不会发起网络请求）
+        :return: {symbol: TradingSignal 或 None}
+        """
+        higher_tf = self.higher_tf_map.get(timeframe)
+        reqs_by_symbol = {
+            symbol: [(symbol, timeframe, self._SIGNAL_BARS)]
+                    + ([(symbol, higher_tf, self._TREND_BARS)] if higher_tf else [])
+            for symbol in symbols
+        }
+        fetched = await self.exchange.get_ohlcv_many([req for reqs in reqs_by_symbol.values() for req in reqs])
+        # 指标计算（含numba首次编译）放到线程中执行，不占用事件循环
+        return await asyncio.to_thread(self._analyze_fetched, timeframe, reqs_by_symbol, fetched)
+
+    def _analyze_fetched(self, timeframe: str, reqs_by_symbol: dict, fetched: dict) -> dict:
+        """用预取的K线逐个分析交易对"""
+        results = {}
+        for symbol, reqs in reqs_by_symbol.items():
+            errors = [fetched[req] for req in reqs if isinstance(fetched[req], Exception)]
+            if errors:
+                # 预取失败时跳过，避免在事件循环中退化为同步请求
+                logging.error(f"{symbol} {timeframe} K线预取失败: {str(errors[0])}")
+                results[symbol] = None
+                continue
+            try:
+                results[symbol] = self.analyze(symbol, timeframe, *(fetched[req] for req in reqs))
+            except Exception as e:
+                # 单个交易对分析失败不影响本轮其它交易对
+                logging.error(f"{symbol} {timeframe} 分析失败: {str(e)}")
+                results[symbol] = None
+        return results
+
+    def _get_ohlcv(self, symbol: str, timeframe: str, limit: int = 100) -> np.ndarray:
+        """获取K线数据，(N, 6) 数组：timestamp/open/high/low/close/volume"""
         return self.exchange.get_ohlcv(symbol, timeframe, limit)
 
     @staticmethod
-    def _parse_candle(ohlcv: list) -> dict:
-        """解析交易所返回的K线数据为字典格式"""
-        return {
-            'timestamp': ohlcv[0],  # 时间戳
-            'open': ohlcv[1],  # 开盘价
-            'high': ohlcv[2],  # 最高价
-            'low': ohlcv[3],  # 最低价
-            'close': ohlcv[4],  # 收盘价
-            'volume': ohlcv[5]  # 成交量
-        }
-
-    def _get_trend(self, symbol: str, timeframe: str) -> str:
-        """判断高级别趋势：双EMA策略"""
-        data = self._get_ohlcv(symbol, timeframe, 200)
-        # 提取收盘价数据
-        closes = np.array([c[4] for c in data], dtype=np.float64)
+    def _closed_bars_since(arr: np.ndarray, last_ts: float) -> Optional[range]:
+        """
+        返回 last_ts 之后新收盘的K线下标（不含最后一根未收盘K线）
+        :return: range；last_ts 已不在数据窗口内时返回 None（需要重新播种）
+        """
+        idx = int(np.searchsorted(arr[:, 0], last_ts))
+        if idx > len(arr) - 2 or arr[idx, 0] != last_ts:
+            return None
+        return range(idx + 1, len(arr) - 1)
+
+    def _calculate_ema(self, symbol: str, timeframe: str, arr: np.ndarray, period: int) -> float:
+        """增量计算EMA：已收盘K线推进状态，未收盘K线只推算一步"""
+        key = (symbol, timeframe, period)
+        close = arr[:, 4]
+        state = self._ema_state.get(key)
+        pending = self._closed_bars_since(arr, state[0]) if state else None
+        if pending is None:
+            # 首次计算或数据断档：用TA-Lib在已收盘K线上播种
+            ema = talib.EMA(close[:-1], timeperiod=period)[-1]
+            if np.isnan(ema):  # 数据不足
+                return ema
+        else:
+            ema = state[1]
+            for i in pending:
+                ema = _ema_step(ema, close[i], period)
+        self._ema_state[key] = (arr[-2, 0], ema)
+        return _ema_step(ema, close[-1], period)
+
+    def _get_trend(self, symbol: str, timeframe: str, arr: Optional[np.ndarray] = None) -> Trend:
+        """判断高级别趋势：双EMA策略（arr 为预取的K线，None 时自行拉取）"""
+        if arr is None:
+            arr = self._get_ohlcv(symbol, timeframe, self._TREND_BARS)
 
         # 计算50日和200日指数移动平均线
-        ema50 = talib.EMA(closes, timeperiod=50)[-1]
-        ema200 = talib.EMA(closes, timeperiod=200)[-1]
+        ema50 = self._calculate_ema(symbol, timeframe, arr, 50)
+        ema200 = self._calculate_ema(symbol, timeframe, arr, 200)
 
         # 带过滤阈值的趋势判断（防止假信号）
         if ema50 > ema200 * 1.02:  # 金叉且差距>2%
-            return "BULLISH"
+            return Trend.BULLISH
         elif ema50 < ema200 * 0.98:  # 死叉且差距>2%
-            return "BEARISH"
-        return "NEUTRAL"  # 震荡区间
+            return Trend.BEARISH
+        return Trend.NEUTRAL  # 震荡区间
 
-    def _create_signal(self, symbol: str, timeframe: str,
-                       direction: str, candle: dict, trend: str) -> Optional[TradingSignal]:
-        """根据形态检测结果创建交易信号"""
+    def _create_signal(self, symbol: str, timeframe: str, direction: Direction, trend: Trend, atr: float,
+                       entry_price: float, stop_loss: float, take_profit: float,
+                       confidence: float) -> Optional[TradingSignal]:
+        """根据形态检测结果及 _compute_levels 算出的价位创建交易信号"""
         # 趋势过滤：只保留顺势或中性趋势中的信号
-        if trend not in ["NEUTRAL", direction.upper()]:
-            logging.debug(f"趋势不符过滤: {direction} vs {trend}")
+        if trend not in (Trend.NEUTRAL, direction):
+            logging.debug(f"趋势不符过滤: {direction.name} vs {trend.name}")
             return None
 
-        # 计算平均真实波动范围（ATR）用于仓位和止损计算
-        atr = self._calculate_atr(symbol, timeframe)
-
         # 风险管理：计算仓位大小和杠杆
-        position_size, leverage = self.risk_manager.calculate_position(
-            timeframe, self._calculate_confidence(candle, atr)
-        )
+        position_size, leverage = self.risk_manager.calculate_position(timeframe, confidence)
 
         # 构建交易信号对象
         return TradingSignal(
             symbol=symbol,
             timeframe=timeframe,
-            direction=direction.upper(),
-            entry_price=candle['close'],
-            stop_loss=self._calculate_stop_loss(candle, direction, atr),
-            take_profit=self._calculate_take_profit(candle, direction, atr),
+            direction=direction.name,
+            entry_price=entry_price,
+            stop_loss=stop_loss,
+            take_profit=take_profit,
             position_size=position_size,
             leverage=leverage,
-            confidence=self._calculate_confidence(candle, atr)
+            confidence=confidence,
+            atr=atr
         )
 
-    def _calculate_atr(self, symbol: str, timeframe: str, period: int = 14) -> float:
-        """计算平均真实波动范围（ATR）"""
-        data = self._get_ohlcv(symbol, timeframe, 100)
-        high = np.array([c[2] for c in data], dtype=np.float64)
-        low = np.array([c[3] for c in data], dtype=np.float64)
-        close = np.array([c[4] for c in data], dtype=np.float64)
-        # 使用TALIB计算ATR
-        return talib.ATR(high, low, close, timeperiod=period)[-1]
-
-    @staticmethod
-    def _calculate_stop_loss(candle: dict, direction: str, atr: float) -> float:
-        """计算止损价格"""
-        if direction.upper() == 'BULLISH':  # 多头：止损设在最低点下方0.5倍ATR
-            return candle['low'] - 0.5 * atr
-        return candle['high'] + 0.5 * atr  # 空头：止损设在最高点上方0.5倍ATR
+    def _calculate_atr(self, symbol: str, timeframe: str, arr: np.ndarray, period: int = 14) -> float:
+        """增量计算平均真实波动范围（ATR），arr 为当前周期K线数组"""
+        key = (symbol, timeframe, period)
+        high, low, close = arr[:, 2], arr[:, 3], arr[:, 4]
+        state = self._atr_state.get(key)
+        pending = self._closed_bars_since(arr, state[0]) if state else None
+        if pending is None:
+            # 首次计算或数据断档：用TA-Lib在已收盘K线上播种
+            atr = talib.ATR(high[:-1], low[:-1], close[:-1], timeperiod=period)[-1]
+            if np.isnan(atr):  # 数据不足
+                return atr
+        else:
+            atr = state[1]
+            for i in pending:
+                atr = _atr_step(atr, close[i - 1], high[i], low[i], close[i], period)
+        self._atr_state[key] = (arr[-2, 0], atr)
+        return _atr_step(atr, close[-2], high[-1], low[-1], close[-1], period)
 
     @staticmethod
-    def _calculate_take_profit(candle: dict, direction: str, atr: float) -> float:
-        """计算止盈价格（风险回报比3:1）"""
+    def _compute_levels(ohlc: np.ndarray, direction_mask: np.ndarray, atr: float):
+        """
+        一次性计算多根K线的止损价、止盈价和置信度
+        :param ohlc: (N, 4) 数组，每行 [open, high, low, close]
+        :param direction_mask: (N,) 数组，>0 为多头，其余按空头计算
+        :return: (stop_loss, take_profit, confidence) 三个 (N,) 数组
+        """
+        open_, high, low, close = ohlc[:, 0], ohlc[:, 1], ohlc[:, 2], ohlc[:, 3]
+        bullish = direction_mask > 0
+
+        # 止损：多头设在最低点下方0.5倍ATR，空头设在最高点上方0.5倍ATR
+        stop_loss = np.where(bullish, low - 0.5 * atr, high + 0.5 * atr)
+        # 止盈：风险回报比3:1，多头入场价+3倍ATR，空头入场价-3倍ATR
         risk_reward_ratio = 3.0
-        if direction.upper() == 'BULLISH':  # 多头：入场价+3倍ATR
-            return candle['close'] + risk_reward_ratio * atr
-        return candle['close'] - risk_reward_ratio * atr  # 空头：入场价-3倍ATR
-
-    @staticmethod
-    def _calculate_confidence(candle: dict, atr: float) -> float:
-        """计算信号置信度（基于实体/影线比例）"""
-        body_size = abs(candle['close'] - candle['open'])
-        candle_range = candle['high'] - candle['low']
+        take_profit = np.where(bullish, close + risk_reward_ratio * atr, close - risk_reward_ratio * atr)
 
-        # 实体占比越高置信度越高
-        confidence = (body_size / candle_range) if candle_range != 0 else 0
-        # 限制在0.3-0.9之间（避免极端值）
-        return min(max(confidence, 0.3), 0.9)
+        # 置信度：实体占比越高置信度越高，限制在0.3-0.9之间（避免极端值）
+        body_size = np.abs(close - open_)
+        candle_range = high - low
+        confidence = np.divide(body_size, candle_range, out=np.zeros_like(body_size), where=candle_range != 0)
+        confidence = np.clip(confidence, 0.3, 0.9)
+        return stop_loss, take_profit, confidence
 
-    def _filter_signal(self, signal: TradingSignal, trend: str) -> bool:
+    def _filter_signal(self, signal: TradingSignal, trend: Trend) -> bool:
         """信号过滤器"""
         # 趋势一致性过滤（重要）
-        if trend not in ["NEUTRAL", signal.direction.upper()]:
+        if trend not in (Trend.NEUTRAL, Direction[signal.direction]):
             return False
 
         # （注释掉的）波动率过滤示例：需要时启用
         # min_atr_ratio = 0.005
         # current_price = signal.entry_price
-        # atr = self._calculate_atr(signal.symbol, signal.timeframe)
-        # if (atr / current_price) < min_atr_ratio:
+        # if (signal.atr / current_price) < min_atr_ratio:
         #     return False
 
         return True  # 通过所有过滤条件
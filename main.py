@@ -4,7 +4,7 @@ import logging
 from config.settings import Settings
 from core.strategies import ProfessionalPinBarStrategy
 from utils.scheduler import SchedulerManager
-from utils.notifiers import ServerChanNotifier, WechatWorkNotifier
+from utils.notifiers import WechatWorkNotifier
 from core.database import DatabaseManager
 
 
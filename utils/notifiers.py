@@ -1,11 +1,90 @@
 # 通知模块
 # utils/notifiers.py
 import requests
-import json
 import logging
+import orjson
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util import connection as urllib3_connection
+from urllib3.util.retry import Retry
 from config.settings import Settings
 
+logger = logging.getLogger(__name__)
+
+# 请求超时：(连接, 读取) 秒
+_TIMEOUT = (3, 5)
+
+# 通知接口域名解析缓存：(host, port, family) -> (过期时间, getaddrinfo结果)
+_DNS_TTL = 300
+_DNS_CACHED_HOSTS = frozenset({"sctapi.ftqq.com", "qyapi.weixin.qq.com"})
+_dns_cache = {}
+_dns_lock = threading.Lock()
+_urllib3_create_connection = urllib3_connection.create_connection
+
+
+def _resolve(host, port, family):
+    """带TTL的 getaddrinfo 缓存"""
+    key = (host, port, family)
+    now = time.monotonic()
+    with _dns_lock:
+        cached = _dns_cache.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    infos = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+    with _dns_lock:
+        _dns_cache[key] = (now + _DNS_TTL, infos)
+    return infos
+
+
+def _create_connection(address, *args, **kwargs):
+    """
+    替换 urllib3 的建连函数：通知接口域名走解析缓存，其余域名保持原逻辑
+    TLS 的 SNI 与证书校验仍使用原域名，不受直接按IP建连的影响
+    """
+    host, port = address
+    if host not in _DNS_CACHED_HOSTS:
+        return _urllib3_create_connection(address, *args, **kwargs)
+
+    family = urllib3_connection.allowed_gai_family()
+    err = None
+    for *_, sockaddr in _resolve(host, port, family):
+        try:
+            return _urllib3_create_connection((sockaddr[0], port), *args, **kwargs)
+        except OSError as e:
+            err = e
+    # 缓存的地址全部不可用，下次重新解析
+    with _dns_lock:
+        _dns_cache.pop((host, port, family), None)
+    raise err
+
+
+urllib3_connection.create_connection = _create_connection
+
+
+def _build_session() -> requests.Session:
+    """创建带连接池的会话：复用TCP/TLS连接，失败重试交由 urllib3 处理"""
+    session = requests.Session()
+    # 连接/读取失败及限频、服务端错误时带抖动指数退避重试（最长8秒），遵循 Retry-After；
+    # 默认不重试POST，通知接口需显式放开（重试过程由 urllib3 记录日志）
+    retries = Retry(
+        total=4,
+        connect=3,
+        read=3,
+        backoff_factor=0.5,
+        backoff_max=8,
+        backoff_jitter=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retries))
+    return session
+
 
 class Notifier:
     """通知基类"""
@@ -23,6 +102,7 @@ class ServerChanNotifier(Notifier):
     def __init__(self):
         self.sckey = Settings.SERVERCHAN_SCKEY
         self.base_url = f"https://sctapi.ftqq.com/{self.sckey}.send"
+        self.session = _build_session()
 
     def send(self, title: str, content: str) -> bool:
         try:
@@ -30,18 +110,22 @@ class ServerChanNotifier(Notifier):
                 "title": title,
                 "desp": content
             }
-            response = requests.post(self.base_url, data=payload)
-            result = response.json()
+            response = self.session.post(self.base_url, data=payload, timeout=_TIMEOUT,
+                                         stream=False, allow_redirects=False)
+            if not response.ok:
+                logger.error("ServerChan通知失败: HTTP %s", response.status_code)
+                return False
+            result = orjson.loads(response.content)
 
             if result.get("code") == 0:
-                logging.info(f"ServerChan通知成功: {title}")
+                logger.info("ServerChan通知成功: %s", title)
                 return True
             else:
-                logging.error(f"ServerChan通知失败: {result.get('message')}")
+                logger.error("ServerChan通知失败: %s", result.get("message"))
                 return False
 
         except Exception as e:
-            logging.error(f"ServerChan连接异常: {str(e)}")
+            logger.error("ServerChan连接异常: %s", e)
             return False
 
 
@@ -50,45 +134,71 @@ class WechatWorkNotifier(Notifier):
     企业微信机器人Webhook通知
     文档：https://work.weixin.qq.com/api/doc/90000/90136/91770
     """
+    _MAX_RETRIES = 3  # 单次发送最多尝试次数
+    _BACKOFF_BASE = 1.0  # 退避基数（秒）
+    _BACKOFF_CAP = 8.0  # 单次退避上限（秒）
+    _RETRY_ERRCODES = {-1, 45009}  # 可重试错误：系统繁忙 / 接口调用超过频率限制
+    _COOLDOWN = 60  # 重试耗尽后的熔断冷却时间（秒）
+    # 预序列化的markdown消息外壳，发送时只需序列化正文
+    _ENVELOPE_HEAD = b'{"msgtype":"markdown","markdown":{"content":'
+    _ENVELOPE_TAIL = b'}}'
 
     def __init__(self):
         self.webhook_key = Settings.WECHATWORK_WEBHOOK_KEY
         self.webhook_url = f"https://qyapi.weixin.qq.com/cgi-bin/webhook/send?key={self.webhook_key}"
+        self.session = _build_session()
+        self.session.headers["Content-Type"] = "application/json"
+        self._cooldown_until = 0.0
 
     def send(self, title: str, content: str) -> bool:
+        # 熔断期内直接放弃，避免持续失败时拖慢调度线程
+        if time.monotonic() < self._cooldown_until:
+            logger.warning("企业微信机器人通知熔断中，跳过: %s", title)
+            return False
+
         # 构建markdown消息，将标题和内容组合
         # 注意：markdown内容中可以使用标题格式，但整个消息内容不能超过4096字节
         markdown_content = f"## {title}\n{content}"
-
-        payload = {
-            "msgtype": "markdown",
-            "markdown": {
-                "content": markdown_content
-            }
-        }
-
-        headers = {
-            "Content-Type": "application/json"
-        }
-
-        try:
-            response = requests.post(self.webhook_url, headers=headers, data=json.dumps(payload))
-            result = response.json()
-
-            if result.get("errcode") == 0:
-                logging.info(f"企业微信机器人通知成功: {title}")
-                return True
-            else:
-                logging.error(f"企业微信机器人通知失败: {result.get('errmsg')}")
+        body = self._ENVELOPE_HEAD + orjson.dumps(markdown_content) + self._ENVELOPE_TAIL
+        for attempt in range(self._MAX_RETRIES):
+            try:
+                response = self.session.post(self.webhook_url, data=body, timeout=_TIMEOUT,
+                                             stream=False, allow_redirects=False)
+                # 非2xx响应不解析响应体
+                if not response.ok:
+                    logger.error("企业微信机器人通知失败: HTTP %s", response.status_code)
+                    return False
+                result = orjson.loads(response.content)
+
+                if result.get("errcode") == 0:
+                    logger.info("企业微信机器人通知成功: %s", title)
+                    return True
+                logger.error("企业微信机器人通知失败: %s", result.get("errmsg"))
+                if result.get("errcode") not in self._RETRY_ERRCODES:
+                    return False
+
+            except requests.RequestException as e:
+                # 网络层重试已由会话适配器完成，不再重复重试
+                logger.error("企业微信机器人连接异常: %s", e)
+                break
+            except Exception as e:
+                logger.error("企业微信机器人响应异常: %s", e)
                 return False
 
-        except Exception as e:
-            logging.error(f"企业微信机器人连接异常: {str(e)}")
-            return False
+            # 带抖动的指数退避
+            if attempt < self._MAX_RETRIES - 1:
+                time.sleep(min(self._BACKOFF_CAP, self._BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.5))
+
+        self._cooldown_until = time.monotonic() + self._COOLDOWN
+        return False
 
 
 class MultiNotifier(Notifier):
-    """组合通知（可同时使用多个渠道）"""
+    """
+    组合通知（可同时使用多个渠道）
+    NOTIFIER_MODE: "all" 各渠道并发发送；"any" 按顺序发送，任一渠道成功即返回
+    """
+    _DEDUP_MAXSIZE = 256  # 去重记录最大条目数
 
     def __init__(self):
         self.notifiers = []
@@ -96,10 +206,30 @@ class MultiNotifier(Notifier):
             self.notifiers.append(ServerChanNotifier())
         if Settings.ENABLE_WECHATWORK:
             self.notifiers.append(WechatWorkNotifier())
+        self.mode = getattr(Settings, "NOTIFIER_MODE", "all")
+        # 各渠道并发发送，总耗时取决于最慢的渠道而非各渠道之和
+        self._pool = ThreadPoolExecutor(max_workers=max(len(self.notifiers), 1), thread_name_prefix="notifier")
+        # 已成功发送的 (标题, 内容, 分钟) 记录，多个周期同一分钟内触发的相同消息只发一次
+        self._sent = {}
+        self._sent_lock = threading.Lock()
 
     def send(self, title: str, content: str) -> bool:
-        success = False
-        for notifier in self.notifiers:
-            if notifier.send(title, content):
-                success = True
+        key = (title, content, int(time.time() // 60))
+        with self._sent_lock:
+            if key in self._sent:
+                logger.info("重复通知已忽略: %s", title)
+                return True
+
+        if self.mode == "any":
+            success = any(notifier.send(title, content) for notifier in self.notifiers)
+        else:
+            results = self._pool.map(lambda notifier: notifier.send(title, content), self.notifiers)
+            success = any(list(results))
+
+        if success:
+            with self._sent_lock:
+                self._sent[key] = True
+                if len(self._sent) > self._DEDUP_MAXSIZE:
+                    # 淘汰最早写入的条目
+                    self._sent.pop(next(iter(self._sent)))
         return success
\ No newline at end of file
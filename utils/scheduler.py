@@ -1,23 +1,45 @@
 # 定时任务
-from apscheduler.schedulers.background import BackgroundScheduler
+import asyncio
+import logging
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from config.settings import Settings
 
+logger = logging.getLogger(__name__)
+
+# 信号通知模板（相邻字面量在编译期拼接为一个常量）
+_SIGNAL_TEMPLATE = ("🚨🚨🚨：{symbol}\n"
+                    "时间级别：{timeframe}，交易方向：{direction}\n"
+                    "入场点位：{entry_price}\n"
+                    "止盈点位：{take_profit}\n"
+                    "盈利点数：{tp_points}\n"
+                    "止损点位：{stop_loss}\n"
+                    "亏损点数：{sl_points}\n")
+
 
 class SchedulerManager:
+    _MAX_MESSAGE_BYTES = 4000  # 企业微信markdown消息上限4096字节，预留标题空间
+
     def __init__(self, strategy, notifier, db):
         self.strategy = strategy
         self.notifier = notifier
         self.db = db
-        self.scheduler = BackgroundScheduler()
+        # 调度、K线拉取共用同一个事件循环，任务以协程方式执行
+        self._loop = asyncio.new_event_loop()
+        self.scheduler = AsyncIOScheduler(event_loop=self._loop)
+        # 配置在启动时固化，定时任务触发时不再重复读取 Settings
+        self._symbols = tuple(Settings.SYMBOLS)
+        self._tf_config = dict(Settings.TIMEFRAMES)
+        self._triggers = {tf: CronTrigger(**config['trigger']) for tf, config in self._tf_config.items()}
 
     def _add_jobs(self):
         """添加定时任务"""
         # 多时间框架任务
-        for tf, config in Settings.TIMEFRAMES.items():
+        for tf, trigger in self._triggers.items():
             self.scheduler.add_job(
                 self._check_timeframe,
-                trigger=CronTrigger(**config['trigger']),
+                trigger=trigger,
                 kwargs={'timeframe': tf},
                 name=f'{tf}_check'
             )
@@ -30,54 +52,65 @@ class SchedulerManager:
             name='heartbeat'
         )
 
-    def _check_timeframe(self, timeframe):
+    async def _check_timeframe(self, timeframe):
         """执行指定时间框架的信号检查"""
         self.db.log_message('INFO', f"开始检查 {timeframe} 级别信号")
 
         try:
             # 获取当前时间框架配置
-            config = Settings.TIMEFRAMES.get(timeframe, {})
+            config = self._tf_config.get(timeframe)
             if not config:
                 self.db.log_message('WARNING', f"未找到 {timeframe} 的时间框架配置")
                 return
 
-            # 遍历所有交易对
-            for symbol in Settings.SYMBOLS:
-                try:
-                    # 执行策略分析
-                    signal = self.strategy.analyze(
-                        symbol=symbol,
-                        timeframe=timeframe,
-                    )
-
-                    # 处理生成的信号
-                    if signal:
-                        self._process_signal(signal)
+            # 并发预取所有交易对的K线后逐个分析，信号合并为一条通知
+            results = await self.strategy.analyze_many(self._symbols, timeframe)
+            signals = [signal for signal in results.values() if signal]
 
-                except Exception as e:
-                    err_msg = f"{symbol} {timeframe} 分析失败: {str(e)}"
-                    self.db.log_message('ERROR', err_msg)
-                    self.notifier.send("error", err_msg)
+            # 处理本轮生成的所有信号
+            if signals:
+                await self._process_signals(signals)
 
         except Exception as e:
             self.db.log_message('CRITICAL', f"全局检查失败: {str(e)}")
-            self.notifier.send("error", f"定时任务崩溃: {str(e)}")
+            await self._send("error", f"定时任务崩溃: {str(e)}")
+
+    async def _send(self, title, content):
+        """通知渠道为阻塞式HTTP请求，放到线程中执行，避免阻塞事件循环"""
+        return await asyncio.to_thread(self.notifier.send, title, content)
 
-    def _process_signal(self, signal):
-        """处理交易信号"""
+    async def _process_signals(self, signals):
+        """批量处理交易信号：一次入库，合并为尽量少的通知消息"""
+        # 记录到数据库
+        self.db.log_signals(signals)
+        # 发送通知（超出单条消息长度时分段）
+        title = f"交易信号×{len(signals)}"
+        for body in self._chunk_messages([self._format_signal(signal) for signal in signals]):
+            logger.info("交易信号=%s", body)
+            await self._send(title, body)
+
+    def _chunk_messages(self, messages):
+        """按字节上限合并消息，返回分段后的消息体列表"""
+        chunks, current, size = [], [], 0
+        for msg in messages:
+            msg_size = len(msg.encode('utf-8')) + 1  # 含分隔换行
+            if current and size + msg_size > self._MAX_MESSAGE_BYTES:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(msg)
+            size += msg_size
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
+
+    async def _process_signal(self, signal):
+        """处理单个交易信号"""
         # 记录到数据库
         self.db.log_signal(signal)
         # 发送通知
-        msg = (f"🚨🚨🚨：{signal.symbol}\n"
-               f"时间级别：{signal.timeframe}，"
-               f"交易方向：{'多⬆️' if signal.direction == 'BULLISH' else '空⬇️'}\n"
-               f"入场点位：{signal.entry_price}\n"
-               f"止盈点位：{signal.take_profit}\n"
-               f"盈利点数：{abs(signal.take_profit - signal.entry_price)}\n"
-               f"止损点位：{signal.stop_loss}\n"
-               f"亏损点数：{abs(signal.stop_loss - signal.entry_price)}\n")
-        print(f"交易信号={msg}", )
-        self.notifier.send("交易信号", msg)
+        msg = self._format_signal(signal)
+        logger.info("交易信号=%s", msg)
+        await self._send("交易信号", msg)
 
         # 执行风控检查
         # if self.strategy.risk_manager.validate_signal(signal):
@@ -86,18 +119,34 @@ class SchedulerManager:
         # else:
         #     self.db.log_message('WARNING', f"信号未通过风控: {signal.symbol}")
 
-    def _heartbeat(self):
+    @staticmethod
+    def _format_signal(signal):
+        """生成单个信号的通知文本"""
+        return _SIGNAL_TEMPLATE.format(
+            symbol=signal.symbol,
+            timeframe=signal.timeframe,
+            direction='多⬆️' if signal.direction == 'BULLISH' else '空⬇️',
+            entry_price=signal.entry_price,
+            take_profit=signal.take_profit,
+            tp_points=abs(signal.take_profit - signal.entry_price),
+            stop_loss=signal.stop_loss,
+            sl_points=abs(signal.stop_loss - signal.entry_price),
+        )
+
+    async def _heartbeat(self):
         """系统心跳"""
-        print("系统运行正常")
+        logger.info("系统运行正常")
         self.db.log_message('INFO', "系统运行正常")
 
     def start(self):
         """启动调度器"""
         self._add_jobs()
+        asyncio.set_event_loop(self._loop)
         self.scheduler.start()
         try:
-            while True:
-                pass
+            self._loop.run_forever()
         except (KeyboardInterrupt, SystemExit):
-            self.scheduler.shutdown()
+            self.scheduler.shutdown(wait=False)
+            self._loop.run_until_complete(self.strategy.exchange.close())
+            self._loop.close()
             self.db.log_message('INFO', "系统正常关闭")